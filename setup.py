@@ -4,12 +4,16 @@ import os
 
 from setuptools import setup
 
+# marker in README.rst which the long description follows
+LONG_DESCRIPTION_SPLIT = 'long_description split'
+
 # get absolute source directory path
 here = os.path.abspath(os.path.dirname(__file__))
 
 # Get the long description from the README file
 with open(os.path.join(here, 'README.rst'), encoding='utf-8') as readme_file:
-    long_description = readme_file.read().split('long_description split')[1].strip()
+    readme = readme_file.read()
+    long_description = readme[readme.index(LONG_DESCRIPTION_SPLIT) + len(LONG_DESCRIPTION_SPLIT):].strip()
 
 setup(
     name='robotframework-docker',
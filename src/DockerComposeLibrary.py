@@ -1,12 +1,25 @@
 # -*- coding: utf-8 -*-
-# pylint: disable=C0103
+# pylint: disable=C0103, C0302
 """Robot Framework Docker Library."""
 
+import collections
+import concurrent.futures
+import functools
+import json
 import os
 import re
+import shutil
+import socket
+import struct
 import subprocess
-import sys
+from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
 
 import packaging.version
 from robot.api import logger
@@ -14,14 +27,66 @@ from robot.libraries.BuiltIn import BuiltIn
 from robot.libraries.BuiltIn import RobotNotRunningError
 from robot.libraries.DateTime import convert_time
 
+# encoding of Docker Compose output and files written by the library
+_ENCODING = 'utf-8'
 
-# pylint: disable=R0903
-class ExposedServiceInfo:
+# Docker Compose versions that introduced options used by the library
+_V_1_18 = packaging.version.Version('1.18.0')
+_V_1_19 = packaging.version.Version('1.19.0')
+_V_1_23 = packaging.version.Version('1.23.0')
+_V_2_0 = packaging.version.Version('2.0.0')
+
+# characters that are replaced in suite name to make a project name
+_NON_WORD_RE = re.compile(r'\W', re.ASCII)
+
+# version number in 'docker compose version' and 'docker-compose --version' output
+_VERSION_RE = re.compile(r'\d+(?:\.\d+)+')
+
+# container id as it appears in the paths of files mounted into a container
+_CONTAINER_ID_RE = re.compile(rb'containers/([0-9a-f]{64})/')
+
+# number of output lines kept to report a failure of a streamed command
+_OUTPUT_TAIL_LINES = 50
+
+# key of the published ports map in the cache of read-only Docker Compose queries
+_PORT_MAP_CACHE_KEY = ('port map',)
+
+# image reference in 'docker image inspect' error reported for a missing image
+_NO_SUCH_IMAGE_RE = re.compile(r'No such image: (\S+)', re.IGNORECASE)
+
+# route flag marking routes that use a gateway (see route(8))
+_RTF_GATEWAY = 0x0002
+
+
+@functools.lru_cache(maxsize=32)
+def _convert_timeout(timeout: str) -> str:
+    """Helper function to convert Robot Framework time string to a number of seconds.
+    Results are cached, since the same few timeout strings are used over and over."""
+    return str(int(convert_time(timeout)))
+
+
+class ExposedServiceInfo(NamedTuple):
     """Defines info for specific exposed service port."""
     host: str
     port: str
 
 
+class _DockerCompose(NamedTuple):
+    """Docker Compose executable, its version and features depending on it."""
+    cmd: List[str]
+    # Docker CLI executable used for commands that do not go through Docker Compose
+    docker: str
+    version: packaging.version.Version
+    supports_always_recreate_deps: bool
+    supports_renew_anon_volumes: bool
+    supports_down_timeout: bool
+    # Docker Compose V2 always builds in parallel, so --parallel is only used by default with V1
+    builds_in_parallel_by_default: bool
+    # Docker Compose V2 supports --wait and JSON output for ps and config
+    is_v2: bool
+
+
+# pylint: disable=R0902
 class DockerComposeLibrary:
     """DockerComposeLibrary is a part of Robot Framework Docker Library
     that is used for running multi-container Docker applications using 'docker-compose'.
@@ -29,39 +94,50 @@ class DockerComposeLibrary:
 
     ROBOT_LIBRARY_SCOPE = 'TEST SUITE'
 
-    _docker_compose_cmd: [str]
-    _docker_compose_version: packaging.version.Version
+    # Docker Compose shared by all library instances, by PATH it has been found on
+    _docker_compose_info: Dict[str, _DockerCompose] = {}
+
+    _found_docker_compose: _DockerCompose = None
+    _base_cmd: Tuple[str, ...] = None
+    # output of read-only Docker Compose commands and the port map parsed from it
+    _compose_cache: Dict[tuple, Union[str, Dict[Tuple[str, int, str], Tuple[str, str]]]]
     _file: str = None
     _project_name: str = None
     _project_directory: str = None
 
     def __init__(self,
-                 file: str = None,
+                 file: Union[str, os.PathLike] = None,
                  project_name: str = None,
-                 project_directory: str = None):
+                 project_directory: Union[str, os.PathLike] = None):
         """Initializes an instance of DockerComposeLibrary to use a given Compose file and project name.
 
         `file` Path to compose file. By default, tries to use 'docker-compose.yml'
         in a directory where current test suite source file is located.
 
         `project_name` Specify an alternate project name (default: test suite name).
-        """
-        self._find_docker_compose()
-        logger.info(f'[Docker Compose Library] Using Docker Compose v${self._docker_compose_version}')
 
+        `project_directory` Specify an alternate working directory
+        for Docker Compose (default: test suite directory).
+        """
         # get suite name and path to source and don't explode in case the library is created outside Robotframework
         # see https://github.com/vogoltsov/robotframework-docker/issues/30
+        # suite variables are only looked up when they are needed to compute a default
         suite_name = '_'
         suite_dir = os.getcwd()
-        try:
-            suite_name = BuiltIn().get_variable_value('${SUITE NAME}')
-            suite_source = BuiltIn().get_variable_value('${SUITE SOURCE}')
-            suite_dir = os.path.dirname(suite_source)
-        except RobotNotRunningError:
-            pass
+        need_suite_name = project_name is None
+        need_suite_dir = project_directory is None or file is None or not os.path.isabs(file)
+        if need_suite_name or need_suite_dir:
+            try:
+                builtin = BuiltIn()
+                if need_suite_name:
+                    suite_name = builtin.get_variable_value('${SUITE NAME}')
+                if need_suite_dir:
+                    suite_dir = os.path.dirname(builtin.get_variable_value('${SUITE SOURCE}'))
+            except RobotNotRunningError:
+                pass
 
         if file is not None:
-            self._file = file
+            self._file = os.fspath(file)
         else:
             # by default, use docker-compose.yml located in the suite directory
             self._file = 'docker-compose.yml'
@@ -69,10 +145,10 @@ class DockerComposeLibrary:
         if project_name is not None:
             self._project_name = project_name
         else:
-            self._project_name = re.sub(r'\W', '_', suite_name, re.ASCII).lower()
+            self._project_name = _NON_WORD_RE.sub('_', suite_name).lower()
 
         if project_directory is not None:
-            self._project_directory = project_directory
+            self._project_directory = os.fspath(project_directory)
         else:
             # by default, use suite directory as project directory
             self._project_directory = suite_dir
@@ -81,56 +157,102 @@ class DockerComposeLibrary:
         if not os.path.isabs(self._file):
             self._file = os.path.join(suite_dir, self._file)
 
+        self._compose_cache = {}
+
         logger.info(f'[Docker Compose Library] Project "{self._project_name}"'
                     f' initialized using configuration file: {self._file}')
 
     def docker_compose_version(self) -> str:
         """Returns Docker Compose version."""
-        return self._docker_compose_version.base_version
+        return self._docker_compose.version.base_version
 
     # pylint: disable=R0912, R0913, C0103
     def docker_compose_pull(self,
                             no_parallel: bool = False,
                             include_deps: bool = False,
-                            service_names: List[str] = None) -> None:
+                            service_names: List[str] = None,
+                            *,
+                            max_parallel: int = None,
+                            prioritize_large: bool = True,
+                            skip_if_present: bool = False,
+                            parallel_limit: int = None) -> None:
         """Pulls images for services defined in a Compose file, but does not start the containers.
         All parameters are forwarded to `docker-compose`.
 
+        Images are pulled in parallel, as Docker Compose does it by default since v1.12.0.
+
         `no_parallel` Disable parallel pulling (default: False).
+        Only use it if pulling images in parallel is causing problems, as it makes pulling slower.
 
         `include_deps` Also pull services declared as dependencies (default: False).
 
         `service_names` A list of service names to be pulled.
 
+        `max_parallel` Pull images with `docker pull` running up to this number of pulls at once,
+        instead of relying on Docker Compose which pulls at most 5 images at once.
+        Images of services that have a build configuration are not pulled in this mode.
+        If service images cannot be determined (e.g. with Docker Compose V1),
+        runs a separate `docker-compose pull` per service instead.
+
+        `prioritize_large` Start pulling the largest images first, as reported by registry
+        (default: True). Only used together with `max_parallel`.
+
+        `skip_if_present` Do not pull images that are already present locally (default: False).
+        If all images are present, Docker Compose is not called at all.
+        Images of services that have a build configuration are not pulled in this mode.
+        Ignored if service images cannot be determined (e.g. with Docker Compose V1).
+
+        `parallel_limit` Maximum number of images pulled at once by Docker Compose
+        (set with `COMPOSE_PARALLEL_LIMIT` environment variable).
+        Not used together with `max_parallel`, which does not rely on Docker Compose to pull images.
+
 
         = Examples =
 
         Pull All Service Images
         | Docker Compose Pull |
-        """
-
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('pull')
-        cmd.append('--quiet')
 
-        if no_parallel:
-            cmd.append('--no-parallel')
-
-        if include_deps:
-            cmd.append('--include-deps')
+        Pull All Service Images Running Up To 10 Pulls At Once
+        | Docker Compose Pull | max_parallel=10 |
+        """
 
+        if max_parallel is not None and max_parallel < 1:
+            raise AssertionError(f'[Docker Compose Pull] max_parallel must be greater than 0, got {max_parallel}')
+
+        service_images = None
+        if max_parallel is not None or skip_if_present:
+            service_images = self._get_service_images(service_names, include_deps)
+        if service_images is not None:
+            if skip_if_present:
+                images = list(dict.fromkeys(image for image, _ in service_images.values()))
+                missing_images = self._get_missing_images(images)
+                service_images = {name: (image, platform) for name, (image, platform) in service_images.items()
+                                  if image in missing_images}
+                if not service_images:
+                    logger.info('[Docker Compose Pull] All images are present, nothing to pull')
+                    return
+            if max_parallel is not None:
+                # images shared by several services are only pulled once for each platform
+                self._pull_images(list(dict.fromkeys(service_images.values())), max_parallel, prioritize_large)
+                return
+            # dependencies are already resolved
+            service_names = list(service_images)
+            include_deps = False
+
+        cmd = self._build_cmd('pull', (
+            (True, '--quiet'),
+            (no_parallel, '--no-parallel'),
+            (include_deps, '--include-deps'),
+        ))
+        if max_parallel is not None:
+            self._run_per_service(cmd, service_names, max_parallel, '[Docker Compose Pull] Failed to pull image(s)')
+            return
         if service_names is not None:
             cmd.extend(service_names)
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Pull] Failed to pull image(s): {e.output.rstrip()}') from e
+        env = None
+        if parallel_limit is not None:
+            env = {**os.environ, 'COMPOSE_PARALLEL_LIMIT': str(parallel_limit)}
+        self._run(cmd, '[Docker Compose Pull] Failed to pull image(s)', env)
 
     # pylint: disable=R0912, R0913, C0103
     def docker_compose_build(self,
@@ -138,10 +260,12 @@ class DockerComposeLibrary:
                              force_rm: bool = False,
                              no_cache: bool = False,
                              no_rm: bool = False,
-                             parallel: bool = False,
+                             parallel: bool = None,
                              pull: bool = False,
                              build_args: dict = None,
-                             service_names: List[str] = None) -> None:
+                             service_names: List[str] = None,
+                             *,
+                             max_parallel: int = None) -> None:
         """Build or rebuild services.
         All parameters are forwarded to `docker-compose`.
 
@@ -153,13 +277,18 @@ class DockerComposeLibrary:
 
         `no_rm` Do not intermediate containers after a successful build (default: False).
 
-        `parallel` Build images in parallel (default: False).
+        `parallel` Build images in parallel (default: True since Docker Compose v1.23.0).
+        Docker Compose V2 always builds images in parallel.
 
         `pull` Always attempt to pull a newer version of the image (default: False).
 
         `service_names` A list of service names to be built.
         All services are started by default.
 
+        `max_parallel` Run a separate `docker-compose build` per service, up to this number at once.
+        Unlike `parallel`, works with all Docker Compose versions, but build cache is not shared
+        between services built at the same time.
+
 
         = Examples =
 
@@ -167,47 +296,27 @@ class DockerComposeLibrary:
         | Docker Compose Build |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('build')
-        cmd.append('--quiet')
-
-        if compress:
-            cmd.append('--compress')
-
-        if force_rm:
-            cmd.append('--force-rm')
-
-        if no_cache:
-            cmd.append('--no-cache')
-
-        if no_rm:
-            cmd.append('--no-rm')
-
-        if parallel:
-            cmd.append('--parallel')
-
-        if pull:
-            cmd.append('--pull')
-
-        if build_args is not None:
-            for key, value in build_args.items():
-                cmd.append('--build-arg')
-                cmd.append(f'{key}={value}')
-
+        if max_parallel is not None and max_parallel < 1:
+            raise AssertionError(f'[Docker Compose Build] max_parallel must be greater than 0, got {max_parallel}')
+
+        cmd = self._build_cmd('build', (
+            (True, '--quiet'),
+            (compress, '--compress'),
+            (force_rm, '--force-rm'),
+            (no_cache, '--no-cache'),
+            (no_rm, '--no-rm'),
+            (parallel or (parallel is None and self._docker_compose.builds_in_parallel_by_default), '--parallel'),
+            (pull, '--pull'),
+            *((True, ('--build-arg', f'{key}={value}')) for key, value in (build_args or {}).items()),
+        ))
+        if max_parallel is not None:
+            self._run_per_service(cmd, service_names, max_parallel, '[Docker Compose Build] Failed to build image(s)')
+            return
         if service_names is not None:
             cmd.extend(service_names)
+        self._run(cmd, '[Docker Compose Build] Failed to build image(s)')
 
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Build] Failed to build image(s): {e.output.rstrip()}') from e
-
-    # pylint: disable=R0912, R0913, C0103
+    # pylint: disable=R0912, R0913, R0914, C0103
     def docker_compose_up(self,
                           timeout: str = '10 seconds',
                           no_deps: bool = False,
@@ -227,10 +336,12 @@ class DockerComposeLibrary:
         `no_deps` Don't start linked services (default: False).
 
         `force_recreate` Recreate containers even if their configuration
-        and images haven't changed (default: False).
+        and images haven't changed (default: True).
+        Incompatible with `no_recreate`.
 
-        `always_recreate_deps` Recreate dependent containers (default: False).
-        Incompatible with 'no_recreate`.
+        `always_recreate_deps` Recreate dependent containers
+        (default: True, unless `no_recreate` is set).
+        Incompatible with `no_recreate`.
 
         `no_recreate` If containers already exist, don't recreate
 
@@ -258,69 +369,42 @@ class DockerComposeLibrary:
         | Docker Compose Up |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('up')
-        cmd.append('--timeout')
-        cmd.append(str(int(convert_time(timeout))))
-        cmd.append('-d')
-
-        if no_deps:
-            cmd.append('--no-deps')
-
-        if force_recreate:
-            cmd.append('--force-recreate')
-
-        if self._docker_compose_version < packaging.version.Version('1.19.0'):
-            if always_recreate_deps:
-                logger.warn('[Docker Compose Up] option --always-recreate-deps'
-                            f' is only supported since Docker Compose version v1.19.0'
-                            f' (using Docker Compose v{self._docker_compose_version})')
-        elif always_recreate_deps or always_recreate_deps is None:
-            cmd.append('--always-recreate-deps')
-
-        if no_recreate:
-            cmd.append('--no-recreate')
-
-        if no_build:
-            cmd.append('--no-build')
-
-        if no_start:
-            cmd.append('--no-start')
-
-        if build:
-            cmd.append('--build')
-
-        if self._docker_compose_version < packaging.version.Version('1.19.0'):
-            if renew_anon_volumes:
-                logger.warn('[Docker Compose Up] option --renew-anon-volumes'
-                            f' is only supported since Docker Compose version v1.19.0'
-                            f' (using Docker Compose v{self._docker_compose_version})')
-        elif renew_anon_volumes or renew_anon_volumes is None:
-            cmd.append('--renew-anon-volumes')
-
-        if remove_orphans:
-            cmd.append('--remove-orphans')
-
-        if self._docker_compose_version < packaging.version.Version('2.0.0'):
-            if wait:
-                logger.warn('[Docker Compose Up] option --wait'
-                            f' is only supported since Docker Compose version v2.0.0'
-                            f' (using Docker Compose v{self._docker_compose_version})')
-        elif wait or wait is None:
-            cmd.append('--wait')
-
-        if service_names is not None:
-            cmd.extend(service_names)
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Up] Failed to start services: {e.output.rstrip()}') from e
+        # fail fast instead of letting Docker Compose reject incompatible options
+        if no_recreate and force_recreate:
+            raise AssertionError('[Docker Compose Up] Options force_recreate and no_recreate are incompatible')
+        if no_recreate and always_recreate_deps:
+            raise AssertionError('[Docker Compose Up] Options always_recreate_deps and no_recreate are incompatible')
+
+        # options that are enabled by default are only used when supported by Docker Compose
+        docker_compose = self._docker_compose
+        always_recreate_deps = (always_recreate_deps or (always_recreate_deps is None and not no_recreate)) and \
+            self._check_option_supported('Docker Compose Up', '--always-recreate-deps',
+                                         docker_compose.supports_always_recreate_deps, _V_1_19, always_recreate_deps)
+        renew_anon_volumes = (renew_anon_volumes or renew_anon_volumes is None) and \
+            self._check_option_supported('Docker Compose Up', '--renew-anon-volumes',
+                                         docker_compose.supports_renew_anon_volumes, _V_1_19, renew_anon_volumes)
+        wait = (wait or wait is None) and \
+            self._check_option_supported('Docker Compose Up', '--wait',
+                                         docker_compose.is_v2, _V_2_0, wait)
+
+        self._compose_cache.clear()
+        cmd = self._build_cmd('up', (
+            (True, ('--timeout', _convert_timeout(timeout))),
+            (True, '-d'),
+            (no_deps, '--no-deps'),
+            (force_recreate, '--force-recreate'),
+            (always_recreate_deps, '--always-recreate-deps'),
+            (no_recreate, '--no-recreate'),
+            (no_build, '--no-build'),
+            (no_start, '--no-start'),
+            (build, '--build'),
+            (renew_anon_volumes, '--renew-anon-volumes'),
+            (remove_orphans, '--remove-orphans'),
+            (wait, '--wait'),
+        ), service_names)
+        returncode, output = self._stream_output(cmd)
+        if returncode != 0:
+            raise AssertionError(f'[Docker Compose Up] Failed to start services: {output}')
 
     def docker_compose_down(self,
                             timeout: str = None,
@@ -356,37 +440,18 @@ class DockerComposeLibrary:
         | Docker Compose Down |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('down')
-
-        if self._docker_compose_version < packaging.version.Version('1.18.0'):
-            if timeout is not None:
-                logger.warn('[Docker Compose Down] option --timeout'
-                            f' is only supported since Docker Compose version v1.18.0'
-                            f' (using Docker Compose v{self._docker_compose_version})')
-        elif timeout is not None:
-            cmd.append('--timeout')
-            cmd.append(str(int(convert_time(timeout or '10 seconds'))))
+        use_timeout = timeout is not None and \
+            self._check_option_supported('Docker Compose Down', '--timeout',
+                                         self._docker_compose.supports_down_timeout, _V_1_18, True)
 
-        if rmi is not None:
-            cmd.append('--rmi')
-            cmd.append(rmi)
-
-        if volumes:
-            cmd.append('--volumes')
-
-        if remove_orphans:
-            cmd.append('--remove-orphans')
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Down] Failed to shutdown services: {e.output.rstrip()}') from e
+        self._compose_cache.clear()
+        cmd = self._build_cmd('down', (
+            (use_timeout, ('--timeout', _convert_timeout(timeout or '10 seconds'))),
+            (rmi is not None, ('--rmi', rmi)),
+            (volumes, '--volumes'),
+            (remove_orphans, '--remove-orphans'),
+        ))
+        self._run(cmd, '[Docker Compose Down] Failed to shutdown services')
 
     def docker_compose_start(self,
                              service_names: List[str] = None) -> None:
@@ -409,21 +474,9 @@ class DockerComposeLibrary:
         | Docker Compose Start | service_names=${service_names} |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('start')
-
-        if service_names is not None:
-            cmd.extend(service_names)
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Start] Failed to start services: {e.output.rstrip()}') from e
+        self._compose_cache.clear()
+        cmd = self._build_cmd('start', service_names=service_names)
+        self._run(cmd, '[Docker Compose Start] Failed to start services')
 
     def docker_compose_stop(self,
                             timeout: str = '10 seconds',
@@ -447,25 +500,11 @@ class DockerComposeLibrary:
         | Docker Compose Stop | service_names=${service_names} |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('stop')
-
-        if timeout is not None:
-            cmd.append('--timeout')
-            cmd.append(str(int(convert_time(timeout or '10 seconds'))))
-
-        if service_names is not None:
-            cmd.extend(service_names)
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Stop] Failed to stop services: {e.output.rstrip()}') from e
+        self._compose_cache.clear()
+        cmd = self._build_cmd('stop', (
+            (timeout is not None, ('--timeout', _convert_timeout(timeout or '10 seconds'))),
+        ), service_names)
+        self._run(cmd, '[Docker Compose Stop] Failed to stop services')
 
     def docker_compose_restart(self,
                                timeout: str = '10 seconds',
@@ -489,25 +528,11 @@ class DockerComposeLibrary:
         | Docker Compose Restart | service_names=${service_names} |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('restart')
-
-        if timeout is not None:
-            cmd.append('--timeout')
-            cmd.append(str(int(convert_time(timeout or '10 seconds'))))
-
-        if service_names is not None:
-            cmd.extend(service_names)
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Restart] Failed to restart services: {e.output.rstrip()}') from e
+        self._compose_cache.clear()
+        cmd = self._build_cmd('restart', (
+            (timeout is not None, ('--timeout', _convert_timeout(timeout or '10 seconds'))),
+        ), service_names)
+        self._run(cmd, '[Docker Compose Restart] Failed to restart services')
 
     def docker_compose_kill(self,
                             remove_orphans: bool = False,
@@ -532,30 +557,16 @@ class DockerComposeLibrary:
         | Docker Compose Kill | service_names=${service_names} |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('kill')
-
-        if remove_orphans:
-            cmd.append('--remove-orphans')
-
-        if signal is not None:
-            cmd.append('--signal')
-            cmd.append(signal)
-
-        if service_names is not None:
-            cmd.extend(service_names)
-
-        try:
-            output = subprocess.check_output(cmd,
-                                             cwd=self._project_directory,
-                                             stdin=subprocess.DEVNULL,
-                                             stderr=subprocess.STDOUT,
-                                             encoding=sys.getdefaultencoding(),
-                                             text=True)
-            if output == 'no container to kill':
-                raise AssertionError(f'[Docker Compose Kill] No container(s) to kill for service: ${service_names}')
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Kill] Failed to kill services: {e.output.rstrip()}') from e
+        self._compose_cache.clear()
+        cmd = self._build_cmd('kill', (
+            (remove_orphans, '--remove-orphans'),
+            (signal is not None, ('--signal', signal)),
+        ), service_names)
+        process = self._run(cmd, '[Docker Compose Kill] Failed to kill services')
+        # Docker Compose reports this on standard error or output depending on version
+        output = (process.stderr or process.stdout).decode(_ENCODING, errors='replace')
+        if output == 'no container to kill':
+            raise AssertionError(f'[Docker Compose Kill] No container(s) to kill for service: ${service_names}')
 
     def docker_compose_pause(self,
                              service_names: List[str] = None) -> None:
@@ -576,21 +587,8 @@ class DockerComposeLibrary:
         | Docker Compose Pause | service_names=${service_names} |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('pause')
-
-        if service_names is not None:
-            cmd.extend(service_names)
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Pause] Failed to pause services: {e.output.rstrip()}') from e
+        cmd = self._build_cmd('pause', service_names=service_names)
+        self._run(cmd, '[Docker Compose Pause] Failed to pause services')
 
     def docker_compose_unpause(self,
                                service_names: List[str] = None) -> None:
@@ -611,27 +609,17 @@ class DockerComposeLibrary:
         | Docker Compose Unpause | service_names=${service_names} |
         """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('unpause')
-
-        if service_names is not None:
-            cmd.extend(service_names)
-
-        try:
-            subprocess.check_output(cmd,
-                                    cwd=self._project_directory,
-                                    stdin=subprocess.DEVNULL,
-                                    stderr=subprocess.STDOUT,
-                                    encoding=sys.getdefaultencoding(),
-                                    text=True)
-        except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Unpause] Failed to unpause services: {e.output.rstrip()}') from e
+        cmd = self._build_cmd('unpause', service_names=service_names)
+        self._run(cmd, '[Docker Compose Unpause] Failed to unpause services')
 
     def docker_compose_logs(self,
                             write_to: str = None,
                             prefix: bool = True,
                             timestamps: bool = True,
-                            service_names: List[str] = None) -> str:
+                            service_names: List[str] = None,
+                            *,
+                            tail: int = None,
+                            max_bytes: int = None) -> str:
         """Grabs or saves the output from containers.
 
         `write_to` Name of the log file to use. Can be an absolute or
@@ -648,6 +636,12 @@ class DockerComposeLibrary:
 
         `service_names` A list of service names to limit which logs are gotten.
 
+        `tail`: Number of lines to get from the end of the logs for each container
+        (default: all lines).
+
+        `max_bytes`: Maximum number of bytes of logs to capture and return,
+        logs are truncated if they are longer. Not used when logs are written to a file.
+
         = Examples =
 
         Save container logs to a file
@@ -655,24 +649,25 @@ class DockerComposeLibrary:
 
         Grab container logs into a variable
         | ${logs} = | Docker Compose Logs |
-        """
 
-        cmd: [str] = self._prepare_base_cmd()
-        cmd.append('logs')
-        cmd.append('--no-color')
-
-        if not prefix:
-            cmd.append('--no-log-prefix')
+        Grab last 100 lines of logs for each container into a variable
+        | ${logs} = | Docker Compose Logs | tail=100 |
+        """
 
-        if timestamps:
-            cmd.append('--timestamps')
+        cmd = self._build_cmd('logs', (
+            (True, '--no-color'),
+            (not prefix, '--no-log-prefix'),
+            (timestamps, '--timestamps'),
+            (tail is not None, ('--tail', str(tail))),
+        ), service_names)
 
-        if service_names is not None:
-            cmd.extend(service_names)
+        if write_to is None and max_bytes is not None:
+            return self._read_limited_output(cmd, max_bytes, '[Docker Compose Logs] Failed to get service logs')
 
         if write_to is not None:
+            # Docker Compose writes directly to the file descriptor, so no buffering or decoding is needed
             # pylint: disable=consider-using-with
-            output_file = open(write_to, 'a', encoding=sys.getdefaultencoding())
+            output_file = open(write_to, 'ab', buffering=0)
             close_output_file = output_file.close
         else:
             output_file = subprocess.PIPE
@@ -685,10 +680,9 @@ class DockerComposeLibrary:
                                      stdin=subprocess.DEVNULL,
                                      stdout=output_file,
                                      stderr=subprocess.PIPE,
-                                     encoding=sys.getdefaultencoding(),
-                                     text=True)
+                                     encoding=_ENCODING)
         except subprocess.CalledProcessError as e:
-            raise AssertionError(f'[Docker Compose Logs] Failed to get service logs: {e.output.rstrip()}') from e
+            raise AssertionError(f'[Docker Compose Logs] Failed to get service logs: {e.stderr.rstrip()}') from e
         finally:
             close_output_file()
 
@@ -715,135 +709,484 @@ class DockerComposeLibrary:
         """
 
         info = self._get_exposed_port(service_name, port, protocol)
-        service = ExposedServiceInfo()
         if self._is_inside_container():
-            service.host = self._get_container_gateway_ip()
+            host = self._get_container_gateway_ip()
         elif info[0] == '0.0.0.0':
-            service.host = '127.0.0.1'
+            host = '127.0.0.1'
+        elif info[0] == '::':
+            host = '::1'
         else:
-            service.host = info[0]
-        service.port = info[1]
-        return service
+            host = info[0]
+        return ExposedServiceInfo(host=host, port=info[1])
 
     def _get_exposed_port(self, service_name: str, port: int, protocol: str) -> [str]:
-        """Helper function to retrieve info about exposed port by calling 'docker-compose port'."""
-        cmd = self._prepare_base_cmd()
-        cmd.append('port')
-        if protocol is not None:
-            cmd.append('--protocol')
-            cmd.append(protocol)
-        cmd.append(service_name)
-        cmd.append(str(port))
+        """Helper function to retrieve info about exposed port.
+
+        Published ports of all running services are looked up with a single 'docker compose ps' call.
+        Ports missing from there are looked up by calling 'docker-compose port'.
+        """
+        published = self._load_port_map().get((service_name, int(port), protocol or 'tcp'))
+        if published is not None:
+            return list(published)
+
+        args = ['port', *(('--protocol', protocol) if protocol is not None else ()), service_name, str(port)]
 
         try:
-            output = subprocess.check_output(cmd,
-                                             cwd=self._project_directory,
-                                             stdin=subprocess.DEVNULL,
-                                             stderr=subprocess.STDOUT,
-                                             encoding=sys.getdefaultencoding(),
-                                             text=True)
+            output = self._query_compose(args)
         except subprocess.CalledProcessError as e:
             raise AssertionError(f'[Get Exposed Service] Port {port} is not exposed for service {service_name}') from e
 
         # Docker Compose V1 returns empty string when querying port that is not exposed.
         # Docker Compose V2 returns string ':0' in this case.
-        result = output.rstrip().split(':')
-        if len(result) != 2 or (result[0] == '' and result[1] == '0'):
+        # IPv6 addresses are printed in brackets (e.g. '[::1]:8080'), so only the last colon separates the port.
+        host, sep, exposed_port = output.rstrip().rpartition(':')
+        if not sep or (not host and exposed_port == '0'):
             raise AssertionError(f'[Get Exposed Service] Port {port} is not exposed for service {service_name}')
 
-        return result
+        if host.startswith('[') and host.endswith(']'):
+            host = host[1:-1]
+        return [host, exposed_port]
 
-    def _prepare_base_cmd(self) -> [str]:
-        """Helper function to create a 'docker-compose' command with project name and file arguments."""
-        cmd = self._docker_compose_cmd.copy()
+    def _load_port_map(self) -> Dict[Tuple[str, int, str], Tuple[str, str]]:
+        """Helper function to retrieve all published ports with a single 'docker compose ps' call.
+
+        The parsed map is cached together with output of other read-only commands,
+        so that subsequent lookups do not touch the Compose file or parse anything.
+        Returns an empty map if ports cannot be retrieved this way (e.g. with Docker Compose V1).
+        """
+        port_map = self._compose_cache.get(_PORT_MAP_CACHE_KEY)
+        if port_map is None:
+            port_map = self._compose_cache[_PORT_MAP_CACHE_KEY] = self._parse_port_map()
+        return port_map
+
+    def _parse_port_map(self) -> Dict[Tuple[str, int, str], Tuple[str, str]]:
+        """Helper function to build published ports map from 'docker compose ps' output."""
+        port_map = {}
+        if not self._docker_compose.is_v2:
+            return port_map
+
+        try:
+            output = self._query_compose(['ps', '--format', 'json']).strip()
+            # Docker Compose prior to v2.21.0 prints a JSON array, later versions print one object per line.
+            if output.startswith('['):
+                containers = json.loads(output)
+            else:
+                containers = [json.loads(line) for line in output.splitlines() if line]
+        except (subprocess.CalledProcessError, ValueError):
+            return port_map
+
+        for container in containers:
+            for publisher in container.get('Publishers') or []:
+                if not publisher.get('PublishedPort'):
+                    continue
+                key = (container.get('Service'), publisher.get('TargetPort'), publisher.get('Protocol'))
+                # Docker publishes ports on both IPv4 and IPv6 addresses, in no particular order,
+                # IPv4 address is preferred as 'docker-compose port' returns it
+                if key not in port_map or ':' in port_map[key][0]:
+                    port_map[key] = (publisher.get('URL') or '', str(publisher.get('PublishedPort')))
+        return port_map
+
+    def _query_compose(self, args: [str]) -> str:
+        """Helper function to run a read-only 'docker-compose' command (e.g. 'ps', 'port', 'config').
+
+        Output is cached until services are started, stopped or removed by this library,
+        or until anything the configuration depends on changes: the Compose file itself,
+        the project '.env' file or environment variables (e.g. 'image: app:${TAG}', COMPOSE_PROFILES).
+        Failed commands are not cached.
+        Only standard output is returned, so warnings printed by Docker Compose do not get mixed in.
+        """
+        key = (tuple(args),
+               DockerComposeLibrary._get_mtime(self._file),
+               DockerComposeLibrary._get_mtime(os.path.join(self._project_directory, '.env')),
+               frozenset(os.environ.items()))
+        if key not in self._compose_cache:
+            cmd = self._prepare_base_cmd()
+            cmd.extend(args)
+            self._compose_cache[key] = subprocess.run(cmd,
+                                                      check=True,
+                                                      cwd=self._project_directory,
+                                                      stdin=subprocess.DEVNULL,
+                                                      stdout=subprocess.PIPE,
+                                                      stderr=subprocess.PIPE,
+                                                      encoding=_ENCODING).stdout
+        return self._compose_cache[key]
 
-        cmd.append('--project-name')
-        cmd.append(self._project_name)
+    @staticmethod
+    def _get_mtime(path: str) -> Optional[int]:
+        """Helper function to get file modification time. Returns None if the file does not exist."""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    # pylint: disable=R0913
+    def _check_option_supported(self,
+                                keyword: str,
+                                option: str,
+                                supported: bool,
+                                since: packaging.version.Version,
+                                requested) -> bool:
+        """Helper function to check whether an option is supported by Docker Compose.
+        Logs a warning if an unsupported option has been explicitly requested."""
+        if not supported and requested:
+            logger.warn(f'[{keyword}] option {option}'
+                        f' is only supported since Docker Compose version v{since}'
+                        f' (using Docker Compose v{self._docker_compose.version})')
+        return supported
+
+    def _stream_output(self, cmd: [str]) -> Tuple[int, str]:
+        """Helper function to run a command logging its output line by line instead of buffering it.
+        Returns the exit code and the last lines of output."""
+        tail = collections.deque(maxlen=_OUTPUT_TAIL_LINES)
+        with subprocess.Popen(cmd,
+                              cwd=self._project_directory,
+                              stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,
+                              encoding=_ENCODING) as process:
+            for line in process.stdout:
+                line = line.rstrip()
+                logger.debug(line)
+                tail.append(line)
+        return process.returncode, '\n'.join(tail)
+
+    def _get_service_images(self,
+                            service_names: List[str],
+                            include_deps: bool) -> Optional[Dict[str, Tuple[str, Optional[str]]]]:
+        """Helper function to map services that are pulled from a registry to their images and platforms.
+
+        Returns None if images cannot be determined, e.g. because service configuration
+        cannot be retrieved as JSON (Docker Compose V1) or some service does not exist.
+        """
+        if not self._docker_compose.is_v2:
+            return None
+        try:
+            services = json.loads(self._query_compose(['config', '--format', 'json']))['services']
+        except (subprocess.CalledProcessError, ValueError, KeyError):
+            return None
 
-        cmd.append('--file')
-        cmd.append(self._file)
+        names = list(services) if service_names is None else list(service_names)
+        if include_deps:
+            for name in names:
+                for dependency in services.get(name, {}).get('depends_on') or []:
+                    if dependency not in names:
+                        names.append(dependency)
+        if any(name not in services for name in names):
+            return None
+
+        return {name: (services[name]['image'], services[name].get('platform')) for name in names
+                if 'image' in services[name] and 'build' not in services[name]}
+
+    def _pull_images(self, images: List[Tuple[str, Optional[str]]], max_parallel: int, prioritize_large: bool) -> None:
+        """Helper function to pull (image, platform) pairs with 'docker pull' running concurrently."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            if prioritize_large:
+                names = list(dict.fromkeys(image for image, _ in images))
+                sizes = dict(zip(names, executor.map(self._get_image_size, names)))
+                images = sorted(images, key=lambda image: sizes[image[0]], reverse=True)
+            # executor starts queued pulls in order of submission
+            futures = [executor.submit(self._pull_image, image, platform) for image, platform in images]
+            errors = [future.result() for future in futures if future.result()]
+
+        if errors:
+            errors = '\n'.join(errors)
+            raise AssertionError(f'[Docker Compose Pull] Failed to pull image(s): {errors}')
+        logger.info(f'[Docker Compose Pull] Pulled {len(images)} image(s) running up to {max_parallel} pulls at once')
+
+    def _get_missing_images(self, images: List[str]) -> Set[str]:
+        """Helper function to find images that are not present locally, inspecting all of them at once.
+        All images are considered missing if it cannot be determined which of them are."""
+        try:
+            process = subprocess.run([self._docker_compose.docker, 'image', 'inspect', '--format', '{{.Id}}', *images],
+                                     check=False,
+                                     stdin=subprocess.DEVNULL,
+                                     stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE,
+                                     encoding=_ENCODING)
+        except OSError:
+            return set(images)
+        if process.returncode == 0:
+            return set()
+        # Docker reports each missing image as 'No such image: <image>', some versions add default tag
+        references = {match.group(1) for match in _NO_SUCH_IMAGE_RE.finditer(process.stderr)}
+        missing_images = {image for image in images if image in references or f'{image}:latest' in references}
+        return missing_images if missing_images else set(images)
+
+    def _get_image_size(self, image: str) -> int:
+        """Helper function to retrieve compressed image size from registry. Returns 0 if size is unknown."""
+        try:
+            output = subprocess.run([self._docker_compose.docker, 'manifest', 'inspect', '--verbose', image],
+                                    check=True,
+                                    stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL,
+                                    encoding=_ENCODING).stdout
+            manifests = json.loads(output)
+        except (OSError, subprocess.CalledProcessError, ValueError):
+            return 0
+
+        # multi-platform images have a manifest per platform, the largest one is taken as an estimate
+        if isinstance(manifests, dict):
+            manifests = [manifests]
+        sizes = []
+        for manifest in manifests:
+            layers = (manifest.get('SchemaV2Manifest') or manifest.get('OCIManifest') or {}).get('layers') or []
+            sizes.append(sum(layer.get('size', 0) for layer in layers))
+        return max(sizes, default=0)
+
+    def _pull_image(self, image: str, platform: Optional[str]) -> Optional[str]:
+        """Helper function to pull an image for a given platform (default: platform of Docker daemon).
+        Returns error message if image cannot be pulled."""
+        cmd = [self._docker_compose.docker, 'pull', '--quiet', *(('--platform', platform) if platform else ()), image]
+        try:
+            subprocess.check_output(cmd,
+                                    stdin=subprocess.DEVNULL,
+                                    stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as e:
+            return e.output.decode(_ENCODING, errors='replace').rstrip()
+        except OSError as e:
+            return str(e)
+        return None
 
+    def _build_cmd(self,
+                   subcommand: str,
+                   options: Iterable[Tuple[bool, Union[str, Tuple[str, ...]]]] = (),
+                   service_names: List[str] = None) -> [str]:
+        """Helper function to create a 'docker-compose' command for a given subcommand.
+
+        `options` is a sequence of (enabled, argument or tuple of arguments) pairs,
+        arguments are added to the command in order if enabled.
+        """
+        cmd = self._prepare_base_cmd()
+        cmd.append(subcommand)
+        for enabled, arguments in options:
+            if not enabled:
+                continue
+            if isinstance(arguments, str):
+                cmd.append(arguments)
+            else:
+                cmd.extend(arguments)
+        if service_names is not None:
+            cmd.extend(service_names)
         return cmd
 
-    def _find_docker_compose(self) -> [str]:
-        """Helper function to find and set Docker Compose executable and version"""
-        # noinspection PyBroadException
+    def _run_per_service(self,
+                         cmd: [str],
+                         service_names: Optional[List[str]],
+                         max_parallel: int,
+                         error_message: str) -> None:
+        """Helper function to run a command separately for each service, running up to `max_parallel` at once.
+        All services are used if no service names are given. Fails after all commands complete if any of them fail.
+        """
+        if service_names is None:
+            try:
+                service_names = self._query_compose(['config', '--services']).split()
+            except subprocess.CalledProcessError as e:
+                raise AssertionError(f'{error_message}: {e.stderr.rstrip()}') from e
+
+        def run(service_name: str) -> Optional[str]:
+            try:
+                self._run([*cmd, service_name], service_name)
+            except AssertionError as e:
+                return str(e)
+            return None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            errors = [error for error in executor.map(run, service_names) if error]
+
+        if errors:
+            errors = '\n'.join(errors)
+            raise AssertionError(f'{error_message}: {errors}')
+
+    def _run(self,
+             cmd: [str],
+             error_message: str,
+             env: Dict[str, str] = None) -> subprocess.CompletedProcess:
+        """Helper function to run a command capturing its standard output and error separately.
+        Fails with a given message followed by both standard and error output if the command does not succeed.
+        The command inherits the environment of this process unless `env` is given.
+
+        Output is only decoded to report a failure, as most commands are run just for their effect.
+        """
         try:
-            cmd = [
-                'docker',
-                'compose',
-                'version'
-            ]
-            version_string = subprocess.check_output(cmd,
-                                                     cwd=self._project_directory,
-                                                     stdin=subprocess.DEVNULL,
-                                                     stderr=subprocess.STDOUT,
-                                                     encoding=sys.getdefaultencoding(),
-                                                     text=True).rstrip()
+            return subprocess.run(cmd,
+                                  check=True,
+                                  cwd=self._project_directory,
+                                  env=env,
+                                  stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError as e:
+            output = '\n'.join(stream.decode(_ENCODING, errors='replace').rstrip()
+                               for stream in (e.stdout, e.stderr) if stream.strip())
+            raise AssertionError(f'{error_message}: {output}') from e
+
+    def _read_limited_output(self, cmd: [str], max_bytes: int, error_message: str) -> str:
+        """Helper function to run a command and return at most a given number of bytes of its output.
+        The command is terminated as soon as the limit is reached, instead of reading all of its output."""
+        with subprocess.Popen(cmd,
+                              cwd=self._project_directory,
+                              stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE) as process:
+            output = process.stdout.read(max_bytes)
+            # the command may have already exited leaving more output in the pipe
+            truncated = len(output) == max_bytes and process.stdout.read(1) != b''
+            if truncated:
+                process.terminate()
+            _, errors = process.communicate()
+
+        if not truncated and process.returncode != 0:
+            raise AssertionError(f'{error_message}: {errors.decode(_ENCODING, errors="replace").rstrip()}')
+        if truncated:
+            logger.info(f'[Docker Compose Library] Command output truncated to {max_bytes} bytes')
+        return output.decode(_ENCODING, errors='replace')
 
-            self._docker_compose_cmd = ['docker', 'compose']
-            self._docker_compose_version = self._parse_docker_compose_version(version_string)
-            return
-        except subprocess.CalledProcessError:
-            pass
+    def _prepare_base_cmd(self) -> [str]:
+        """Helper function to create a 'docker-compose' command with project name and file arguments."""
+        if self._base_cmd is None:
+            # prefix of all Docker Compose commands, which does not change once the library is initialized
+            self._base_cmd = (*self._docker_compose.cmd, '--project-name', self._project_name, '--file', self._file)
+        return list(self._base_cmd)
+
+    @property
+    def _docker_compose(self) -> _DockerCompose:
+        """Docker Compose executable, version and supported features.
+
+        Docker Compose is only looked up when it is first needed, so suites that never use it do not pay for it.
+        It does not change during a test run, so the lookup result
+        is shared between all library instances (i.e. all test suites) using the same PATH.
+        """
+        if self._found_docker_compose is None:
+            path = os.environ.get('PATH', '')
+            info = DockerComposeLibrary._docker_compose_info.get(path)
+            if info is None:
+                cmd, version = DockerComposeLibrary._detect_docker_compose()
+                info = _DockerCompose(cmd=cmd,
+                                      docker=shutil.which('docker') or 'docker',
+                                      version=version,
+                                      supports_always_recreate_deps=version >= _V_1_19,
+                                      supports_renew_anon_volumes=version >= _V_1_19,
+                                      supports_down_timeout=version >= _V_1_18,
+                                      builds_in_parallel_by_default=_V_1_23 <= version < _V_2_0,
+                                      is_v2=version >= _V_2_0)
+                DockerComposeLibrary._docker_compose_info[path] = info
+            logger.info(f'[Docker Compose Library] Using Docker Compose v{info.version}')
+            self._found_docker_compose = info
+        return self._found_docker_compose
+
+    @staticmethod
+    def _detect_docker_compose() -> Tuple[List[str], packaging.version.Version]:
+        """Helper function to detect Docker Compose executable and version.
+
+        Executables are looked up on path before running them, so that missing ones are not even started.
+        Their full paths are used in commands afterwards.
+        """
+        # Prefer Docker Compose V2, its startup is much faster than V1's.
+        docker = shutil.which('docker')
+        if docker is not None:
+            try:
+                cmd = [
+                    docker,
+                    'compose',
+                    'version',
+                    '--short',
+                ]
+                version_string = subprocess.check_output(cmd,
+                                                         stdin=subprocess.DEVNULL,
+                                                         stderr=subprocess.STDOUT,
+                                                         encoding=_ENCODING).rstrip()
+                return [docker, 'compose'], DockerComposeLibrary._parse_docker_compose_version(version_string)
+            except (OSError, subprocess.CalledProcessError):
+                pass
 
         # Fall back to Docker Compose V1.
+        docker_compose = shutil.which('docker-compose')
+        if docker_compose is None:
+            raise AssertionError('[Docker Compose Library] Unable to find Docker Compose on path')
         try:
             cmd = [
-                'docker-compose',
+                docker_compose,
                 '--version',
             ]
             version_string = subprocess.check_output(cmd,
-                                                     cwd=self._project_directory,
                                                      stdin=subprocess.DEVNULL,
                                                      stderr=subprocess.STDOUT,
-                                                     encoding=sys.getdefaultencoding(),
-                                                     text=True).rstrip()
-            self._docker_compose_cmd = ['docker-compose']
-            self._docker_compose_version = self._parse_docker_compose_version(version_string)
-        except subprocess.CalledProcessError as e:
+                                                     encoding=_ENCODING).rstrip()
+            return [docker_compose], DockerComposeLibrary._parse_docker_compose_version(version_string)
+        except (OSError, subprocess.CalledProcessError) as e:
             raise AssertionError('[Docker Compose Library] Unable to find Docker Compose on path') from e
 
     @staticmethod
     def _parse_docker_compose_version(version_string: str) -> packaging.version.Version:
         """Helper function to parse Docker Compose version string"""
+        match = _VERSION_RE.search(version_string)
+        if match is None:
+            raise AssertionError('[Docker Compose Library] Could not parse docker-compose version')
         try:
-            version_string = re.findall(r'(\d+\.(?:\d+\.)*\d+)', version_string)[0]
-            return packaging.version.Version(version_string)
+            return packaging.version.Version(match.group(0))
         except packaging.version.InvalidVersion as e:
             raise AssertionError('[Docker Compose Library] Could not parse docker-compose version') from e
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def _is_inside_container() -> bool:
         """Helper function to check whether the test is running inside a Docker container."""
+        # Only /.dockerenv is checked: 'container' environment variable and cgroup names are also set by
+        # runtimes sharing host network (e.g. Flatpak, toolbox), where services are not reached via the gateway.
         return os.path.exists('/.dockerenv')
 
-    def _get_container_gateway_ip(self) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _get_container_gateway_ip() -> str:
         """Helper function to retrieve current Docker container gateway ip address."""
+        # Default route of a container points to its network gateway,
+        # reading it from the routing table avoids a round-trip to Docker daemon.
+        gateway_ip = DockerComposeLibrary._get_default_gateway_ip()
+        if gateway_ip is not None:
+            return gateway_ip
+
         cmd = [
             'docker',
             'inspect',
+            '--type',
+            'container',
             '-f',
             '{{range .NetworkSettings.Networks}}{{.Gateway}}{{end}}',
             DockerComposeLibrary._get_container_id()
         ]
         output = subprocess.check_output(cmd,
-                                         cwd=self._project_directory,
                                          stdin=subprocess.DEVNULL,
                                          stderr=subprocess.STDOUT,
-                                         encoding=sys.getdefaultencoding(),
-                                         text=True)
+                                         encoding=_ENCODING)
         return output.rstrip()
 
     @staticmethod
+    def _get_default_gateway_ip() -> Optional[str]:
+        """Helper function to read default gateway ip address from the kernel routing table."""
+        try:
+            with open('/proc/net/route', 'r', encoding=_ENCODING) as file:
+                file.readline()  # skip header
+                for line in file:
+                    # Iface Destination Gateway Flags ..., addresses are hex in native byte order
+                    fields = line.split()
+                    if len(fields) > 3 and fields[1] == '00000000' and int(fields[3], 16) & _RTF_GATEWAY:
+                        return socket.inet_ntoa(struct.pack('=L', int(fields[2], 16)))
+        except (OSError, ValueError):
+            pass
+        return None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
     def _get_container_id() -> str:
         """Helper function to retrieve current Docker container id."""
-        with open('/proc/self/mountinfo', 'r', encoding=sys.getdefaultencoding()) as file:
-            for line in iter(file.readline, b''):
-                if '/docker/containers/' not in line:
-                    continue
-                return line.split('/docker/containers/')[-1].split('/')[0]
+        # Container files (hostname, hosts, resolv.conf) are bind-mounted from the container directory,
+        # which is named after the container id. This works with both cgroup v1 and v2.
+        with open('/proc/self/mountinfo', 'rb') as file:
+            match = _CONTAINER_ID_RE.search(file.read())
+        if match is None:
             raise AssertionError('[Docker Compose Library] Failed to obtain container id')
+        return match.group(1).decode('ascii')
 
     @staticmethod
     def _do_nothing(*args):